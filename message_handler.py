@@ -1,16 +1,17 @@
 from typing import Dict
 
+# Message type -> name of the PastryNode method that handles it
+_DISPATCH = {
+    'JOIN': 'handle_join',
+    'STORE': 'handle_store',
+    'LOOKUP': 'handle_lookup',
+    'ROUTING_INFO': 'handle_routing_info',
+    'PING': 'handle_ping',
+}
+
 def process_message(node, message: Dict) -> Dict:
     """Process incoming messages based on their type."""
-    message_type = message.get('type')
-    
-    if message_type == 'JOIN':
-        return node.handle_join(message)
-    elif message_type == 'STORE':
-        return node.handle_store(message)
-    elif message_type == 'LOOKUP':
-        return node.handle_lookup(message)
-    elif message_type == 'ROUTING_INFO':
-        return node.handle_routing_info(message)
-    else:
-        return {'status': 'error', 'message': 'Unknown message type'}
\ No newline at end of file
+    handler = _DISPATCH.get(message.get('type'))
+    if handler is None:
+        return {'status': 'error', 'message': 'Unknown message type'}
+    return getattr(node, handler)(message)
@@ -1,11 +1,53 @@
-import hashlib
+import asyncio
+import bisect
+import concurrent.futures
 import socket
+import time
+import struct
 import threading
-import json
-from typing import Dict, List, Tuple, Optional, Any
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterable, List, Set, Tuple, Optional, Any
 
+import routing
 from message_handler import process_message
-from utils import hash_key, ID_BITS, ID_SPACE, ROUTING_TABLE_ROWS, ROUTING_TABLE_COLS, LEAF_SET_SIZE
+from utils import hash_key, ID_SPACE, ROUTING_TABLE_ROWS
+from utils import ROUTE_CACHE_MAX, ROUTE_CACHE_TTL, MAX_FRAME_SIZE, encode_message, decode_message
+from utils import PEER_VERIFY_WORKERS, PEER_VERIFY_TIMEOUT, is_valid_address, pack_peers, unpack_peers
+from utils import HANDLER_WORKERS, FORWARD_TIMEOUT, is_valid_node_id
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional; the stdlib event loop works the same way
+    uvloop = None
+
+# Immutable view of a node's routing state. Writers build a new one and swap the reference,
+# so readers take self._snapshot once and never need a lock. Nothing in a published snapshot
+# is mutated again, except `routes`, the LRU of next hops computed from it.
+RoutingSnapshot = namedtuple('RoutingSnapshot', 'leaf_ids leaf_meta table rows peers routes')
+
+# Marks a key absent from storage, since None is a valid stored value
+_MISSING = object()
+
+# Every message on the wire is prefixed with its length as a 4-byte big-endian integer
+FRAME_HEADER = struct.Struct('>I')
+
+def _frame_length(header) -> int:
+    """Decode a frame header, rejecting frames larger than MAX_FRAME_SIZE."""
+    (length,) = FRAME_HEADER.unpack_from(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return length
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    """Read a single length-prefixed frame, raising IncompleteReadError if the peer hangs up."""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    return await reader.readexactly(_frame_length(header))
+
+def _set_nodelay(writer: asyncio.StreamWriter):
+    """Disable Nagle's algorithm; every frame is a complete request or response."""
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
 class PastryNode:
     def __init__(self, ip: str, port: int, bootstrap_node: Optional[Tuple[str, int]] = None):
@@ -17,9 +59,36 @@ class PastryNode:
         self.storage: Dict[int, Any] = {}
         
         # Routing tables
-        self.routing_table = [[None for _ in range(ROUTING_TABLE_COLS)] for _ in range(ROUTING_TABLE_ROWS)]
-        self.leaf_set_smaller: List[Tuple[int, str, int]] = []  # Nodes with smaller IDs
-        self.leaf_set_larger: List[Tuple[int, str, int]] = []   # Nodes with larger IDs
+        # Leaf sets: IDs of both sides in one ascending list, addresses kept alongside.
+        # Routing table: only occupied slots, (row, col) -> (node_id, ip, port), with a per-row
+        # index col -> node so a row can be searched without probing every column.
+        # Known peers: every node in either of them, node_id -> (ip, port), the JOIN reply candidates.
+        # Recently routed keys: key_hash -> (next node, monotonic timestamp), in LRU order.
+        self._snapshot = RoutingSnapshot(
+            leaf_ids=[], leaf_meta={}, table={}, rows=[{} for _ in range(ROUTING_TABLE_ROWS)], peers={},
+            routes=OrderedDict()
+        )
+        # One bit per ID in the ID space, set while that node is in a leaf set or the routing table
+        self._known = bytearray(ID_SPACE // 8)
+        # Serializes writers; readers use the current snapshot without locking
+        self._routing_lock = threading.RLock()
+        
+        # Workers for message handlers, which block while a forwarded request is in flight.
+        # Owned by the node so a slow peer cannot starve the loop's default executor.
+        self._handler_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=HANDLER_WORKERS, thread_name_prefix='pastry-handler'
+        )
+        
+        # Workers for fanning out blocking sends, such as verifying newly learned peers
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=PEER_VERIFY_WORKERS, thread_name_prefix='pastry-io'
+        )
+        
+        # Outgoing connections kept open between requests, keyed by (ip, port).
+        # Only touched from the event loop thread, so it needs no lock.
+        self._conn_pool: Dict[Tuple[str, int], Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = {}
+        # Tasks serving incoming connections, kept referenced until they finish
+        self._client_tasks: Set[asyncio.Task] = set()
         
         # Start the node server
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -27,198 +96,233 @@ class PastryNode:
         self.server_socket.bind((ip, port))
         self.server_socket.listen(5)
         
-        print(f"Node {self.node_id} started at {ip}:{port}")
-        
-        # Start listening for connections in a separate thread
+        # All socket I/O, incoming and outgoing, runs on one event loop in a separate thread
+        self._loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
         self.running = True
-        self.server_thread = threading.Thread(target=self._listen_for_connections)
+        self.server_thread = threading.Thread(target=self._loop.run_forever)
         self.server_thread.daemon = True
         self.server_thread.start()
         
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._on_connect, sock=self.server_socket), self._loop
+        ).result()
+        
+        print(f"Node {self.node_id} started at {ip}:{port}")
+        
         # Join the network if bootstrap node is provided
         if bootstrap_node:
             self.join_network(bootstrap_node)
     
+    @property
+    def leaf_set_smaller(self) -> List[Tuple[int, str, int]]:
+        """Nodes with smaller IDs, closest first."""
+        snap = self._snapshot
+        split = bisect.bisect_left(snap.leaf_ids, self.node_id)
+        return [routing.leaf_node(snap.leaf_meta, node_id) for node_id in reversed(snap.leaf_ids[:split])]
+    
+    @property
+    def leaf_set_larger(self) -> List[Tuple[int, str, int]]:
+        """Nodes with larger IDs, closest first."""
+        snap = self._snapshot
+        split = bisect.bisect_left(snap.leaf_ids, self.node_id)
+        return [routing.leaf_node(snap.leaf_meta, node_id) for node_id in snap.leaf_ids[split:]]
+    
+    @property
+    def routing_table(self) -> Dict[Tuple[int, int], Tuple[int, str, int]]:
+        """Occupied routing table slots, (row, col) -> (node_id, ip, port)."""
+        return self._snapshot.table
+    
     def _generate_node_id(self, seed: str) -> int:
         """Generate a unique node ID based on the IP:port."""
-        hash_obj = hashlib.sha1(seed.encode())
-        # Take first 16 bits (2 bytes) of the hash
-        hash_bytes = hash_obj.digest()[:2]
-        return int.from_bytes(hash_bytes, byteorder='big')
+        return hash_key(seed)
     
-    def _listen_for_connections(self):
-        """Listen for incoming connections from other nodes."""
-        while self.running:
-            try:
-                client_socket, address = self.server_socket.accept()
-                client_handler = threading.Thread(
-                    target=self._handle_client,
-                    args=(client_socket, address)
-                )
-                client_handler.daemon = True
-                client_handler.start()
-            except Exception as e:
-                if self.running:
-                    print(f"Error accepting connection: {e}")
+    def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Start serving a new connection in its own task."""
+        # A plain callback, so start_server does not wrap the task itself: before Python 3.12
+        # it logs a traceback for every connection task that shutdown() cancels
+        task = self._loop.create_task(self._on_client(reader, writer))
+        self._client_tasks.add(task)
+        task.add_done_callback(self._client_tasks.discard)
     
-    def _handle_client(self, client_socket: socket.socket, address: Tuple[str, int]):
-        """Handle incoming client connections."""
+    async def _on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests from a connected node until it hangs up."""
+        address = writer.get_extra_info('peername')
+        _set_nodelay(writer)
         try:
-            data = b""
+            # Connections are persistent, so keep serving frames until the peer hangs up
             while True:
-                chunk = client_socket.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
+                data = await _read_frame(reader)
+                try:
+                    message = decode_message(data)
+                except (ValueError, TypeError):
+                    # The frame was read in full, so answer it and keep the connection;
+                    # hanging up would only make the sender retry the same frame
+                    response: Dict = {'status': 'error', 'message': 'Malformed message'}
+                else:
+                    # Handlers may forward the request and wait for the reply, which needs this
+                    # loop to drive the forwarding connection, so run them off the loop thread
+                    response = await self._loop.run_in_executor(self._handler_pool, process_message, self, message)
                 
-                # Check if we have a complete message
-                if b'\n' in data:
-                    break
-            
-            if data:
-                message = json.loads(data.decode('utf-8'))
-                response = process_message(self, message)
-                if response:
-                    client_socket.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                payload = encode_message(response)
+                writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
         except Exception as e:
-            print(f"Error handling client {address}: {e}")
+            if self.running:
+                print(f"Error handling client {address}: {e}")
         finally:
-            client_socket.close()
+            writer.close()
     
     def update_routing_tables(self, node_id: int, ip: str, port: int):
         """Update routing tables with a new node."""
-        if node_id == self.node_id:
+        if node_id == self.node_id or routing.is_known(self._known, node_id):
             return
         
-        # Update leaf sets
-        if node_id < self.node_id:
-            # Add to smaller leaf set
-            self.leaf_set_smaller.append((node_id, ip, port))
-            self.leaf_set_smaller.sort(key=lambda x: x[0], reverse=True)  # Sort in descending order
-            if len(self.leaf_set_smaller) > LEAF_SET_SIZE:
-                self.leaf_set_smaller = self.leaf_set_smaller[:LEAF_SET_SIZE]
-        else:
-            # Add to larger leaf set
-            self.leaf_set_larger.append((node_id, ip, port))
-            self.leaf_set_larger.sort(key=lambda x: x[0])  # Sort in ascending order
-            if len(self.leaf_set_larger) > LEAF_SET_SIZE:
-                self.leaf_set_larger = self.leaf_set_larger[:LEAF_SET_SIZE]
-        
-        # Update routing table (simplified)
-        # In a real implementation, this would use prefix matching
-        node_id_bin = bin(node_id)[2:].zfill(ID_BITS)
-        self_id_bin = bin(self.node_id)[2:].zfill(ID_BITS)
+        with self._routing_lock:
+            leaf_ids, leaf_meta, table, rows = self._copy_routing_state()
+            if routing.update_routing_tables(
+                self.node_id, leaf_ids, leaf_meta, table, rows, self._known, (node_id, ip, port)
+            ):
+                self._publish(leaf_ids, leaf_meta, table, rows)
+    
+    def _bulk_update_routing(self, nodes: Iterable[Tuple[int, str, int]]):
+        """Update routing tables with many nodes at once, sorting the leaf sets only once."""
+        # Deduplicate by node ID; a peer may appear in both leaf sets and routing table
+        new_nodes = {node[0]: (node[1], node[2]) for node in nodes if node[0] != self.node_id}
+        if not new_nodes:
+            return
         
-        # Find the row based on the first different bit
-        for i in range(min(ROUTING_TABLE_ROWS, ID_BITS)):
-            if node_id_bin[i] != self_id_bin[i]:
-                # Calculate column based on the next 4 bits
-                col_bits = node_id_bin[i:i+4]
-                col = int(col_bits, 2) if len(col_bits) == 4 else int(col_bits + '0' * (4 - len(col_bits)), 2)
-                
-                if col < ROUTING_TABLE_COLS:
-                    self.routing_table[i][col] = (node_id, ip, port)
-                break
+        with self._routing_lock:
+            leaf_ids, leaf_meta, table, rows = self._copy_routing_state()
+            if routing.bulk_update_routing(
+                self.node_id, leaf_ids, leaf_meta, table, rows, self._known, new_nodes
+            ):
+                self._publish(leaf_ids, leaf_meta, table, rows)
+    
+    def _copy_routing_state(self):
+        """Copy the current snapshot's structures so a writer can modify them privately."""
+        snap = self._snapshot
+        return list(snap.leaf_ids), dict(snap.leaf_meta), dict(snap.table), [dict(row) for row in snap.rows]
+    
+    def _publish(self, leaf_ids: List[int], leaf_meta: Dict[int, Tuple[str, int]],
+                 table: Dict[Tuple[int, int], Tuple[int, str, int]], rows: List[Dict[int, Tuple[int, str, int]]]):
+        """Swap in a new routing snapshot; its empty route cache replaces the old one's."""
+        # Collect the JOIN reply candidates once per routing change rather than once per JOIN
+        peers = dict(leaf_meta)
+        peers.update((node[0], (node[1], node[2])) for node in table.values())
+        self._snapshot = RoutingSnapshot(leaf_ids, leaf_meta, table, rows, peers, OrderedDict())
     
     def is_responsible_for_key(self, key_hash: int) -> bool:
         """Determine if this node is responsible for a key."""
-        # Check if we have any nodes in our leaf sets
-        if not self.leaf_set_smaller and not self.leaf_set_larger:
-            return True
-        
-        # Check if the key is between this node and the closest smaller node
-        if self.leaf_set_smaller and key_hash > self.leaf_set_smaller[0][0] and key_hash <= self.node_id:
-            return True
-        
-        # Check if the key is between this node and the closest larger node
-        if self.leaf_set_larger and key_hash > self.node_id and key_hash <= self.leaf_set_larger[0][0]:
-            return True
-        
-        # Handle wrap-around in the ID space
-        if self.leaf_set_smaller and self.leaf_set_larger:
-            largest_node = max(self.leaf_set_larger, key=lambda x: x[0])[0]
-            smallest_node = min(self.leaf_set_smaller, key=lambda x: x[0])[0]
-            
-            if self.node_id > largest_node and key_hash > self.node_id:
-                return True
-            if self.node_id < smallest_node and key_hash < self.node_id:
-                return True
-        
-        return False
+        return routing.is_responsible_for_key(self.node_id, self._snapshot.leaf_ids, key_hash)
     
     def route_to_node(self, key_hash: int) -> Optional[Tuple[int, str, int]]:
         """Find the next node to route a message to for a given key."""
-        # Check if the key is in the range of our leaf sets
-        if self.leaf_set_smaller:
-            for node in self.leaf_set_smaller:
-                if key_hash <= node[0]:
-                    return node
-        
-        if self.leaf_set_larger:
-            for node in self.leaf_set_larger:
-                if key_hash >= node[0]:
-                    return node
-        
-        # Use the routing table (simplified)
-        key_bin = bin(key_hash)[2:].zfill(ID_BITS)
-        self_bin = bin(self.node_id)[2:].zfill(ID_BITS)
-        
-        for i in range(min(ROUTING_TABLE_ROWS, ID_BITS)):
-            if key_bin[i] != self_bin[i]:
-                # Calculate column based on the next 4 bits
-                col_bits = key_bin[i:i+4]
-                col = int(col_bits, 2) if len(col_bits) == 4 else int(col_bits + '0' * (4 - len(col_bits)), 2)
-                
-                if col < ROUTING_TABLE_COLS and self.routing_table[i][col]:
-                    return self.routing_table[i][col]
+        snap = self._snapshot
+        now = time.monotonic()
+        # No lock: each OrderedDict call below is a single C-level operation, atomic under the GIL.
+        # Another reader may remove an entry between two calls, hence the KeyError guards.
+        cached = snap.routes.get(key_hash)
+        if cached is not None:
+            node, stamp = cached
+            if now - stamp < ROUTE_CACHE_TTL:
+                try:
+                    snap.routes.move_to_end(key_hash)
+                except KeyError:
+                    pass
+                return node
+            snap.routes.pop(key_hash, None)
+        
+        node = routing.find_route(self.node_id, snap.leaf_ids, snap.leaf_meta, snap.rows, key_hash)
+        if node is not None:
+            # Routes are cached on the snapshot they were computed from, so a route computed
+            # while a writer swaps in new state can never be served from the new snapshot
+            snap.routes[key_hash] = (node, now)
+            if len(snap.routes) > ROUTE_CACHE_MAX:
+                try:
+                    snap.routes.popitem(last=False)
+                except KeyError:
+                    pass
+        return node
+    
+    async def _acquire_connection(self, ip: str, port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Take a pooled connection to a node, or dial a new one."""
+        conn = self._conn_pool.pop((ip, port), None)
+        if conn is not None:
+            return conn
+        
+        reader, writer = await asyncio.open_connection(ip, port)
+        _set_nodelay(writer)
+        return reader, writer
+    
+    def _release_connection(self, ip: str, port: int, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        """Return a healthy connection to the pool."""
+        if self.running and (ip, port) not in self._conn_pool:
+            self._conn_pool[(ip, port)] = conn
+            return
+        # Another request already pooled a connection to this node (or we are shutting down)
+        conn[1].close()
+    
+    async def _send_async(self, ip: str, port: int, payload: bytes) -> Dict:
+        """Send an encoded message over a pooled connection and wait for the response."""
+        error: Exception = ConnectionError('No attempt made')
+        for attempt in range(2):
+            conn = None
+            try:
+                conn = await self._acquire_connection(ip, port)
+                reader, writer = conn
+                writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+                data = await _read_frame(reader)
                 
-                # If exact match not found, find the closest node
-                for j in range(ROUTING_TABLE_COLS):
-                    if self.routing_table[i][j]:
-                        return self.routing_table[i][j]
-        
-        # If no suitable node found in routing table, return the closest node from leaf sets
-        closest_node = None
-        closest_distance = ID_SPACE
-        
-        for node in self.leaf_set_smaller + self.leaf_set_larger:
-            distance = abs(node[0] - key_hash)
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_node = node
+                self._release_connection(ip, port, conn)
+                return decode_message(data)
+            except asyncio.CancelledError:
+                # A timed-out or cancelled send leaves the connection mid-frame, so it cannot go back to the pool
+                if conn is not None:
+                    conn[1].close()
+                raise
+            except Exception as e:
+                # Drop the broken connection; the next attempt dials a fresh one
+                if conn is not None:
+                    conn[1].close()
+                error = e
         
-        return closest_node
+        print(f"Error sending message to {ip}:{port}: {error}")
+        return {'status': 'error', 'message': str(error)}
     
-    def send_message(self, ip: str, port: int, message: Dict) -> Dict:
+    def send_message(self, ip: str, port: int, message: Dict, timeout: Optional[float] = None) -> Dict:
         """Send a message to another node and get the response."""
+        future = asyncio.run_coroutine_threadsafe(self._send_async(ip, port, encode_message(message)), self._loop)
         try:
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((ip, port))
-            
-            # Send the message
-            client_socket.sendall(json.dumps(message).encode('utf-8') + b'\n')
-            
-            # Receive the response
-            data = b""
-            while True:
-                chunk = client_socket.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
-                
-                # Check if we have a complete message
-                if b'\n' in data:
-                    break
-            
-            client_socket.close()
-            
-            if data:
-                return json.loads(data.decode('utf-8'))
-            else:
-                return {'status': 'error', 'message': 'No response received'}
-        except Exception as e:
-            print(f"Error sending message to {ip}:{port}: {e}")
-            return {'status': 'error', 'message': str(e)}
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            print(f"Timed out sending message to {ip}:{port}")
+            return {'status': 'error', 'message': 'Timed out'}
+        except concurrent.futures.CancelledError:
+            # shutdown() cancels sends still in flight
+            print(f"Cancelled sending message to {ip}:{port}")
+            return {'status': 'error', 'message': 'Cancelled'}
+    
+    def _verify_peer(self, node: Tuple[int, str, int]) -> bool:
+        """Check that a peer is reachable and answers with the node ID we were told."""
+        response = self.send_message(node[1], node[2], {'type': 'PING'}, timeout=PEER_VERIFY_TIMEOUT)
+        return response.get('status') == 'success' and response.get('node_id') == node[0]
+    
+    def _new_peers(self, nodes: Iterable[Tuple[int, str, int]]) -> List[Tuple[int, str, int]]:
+        """Filter out ourselves and peers already in our routing state."""
+        return [
+            node for node in nodes
+            if node[0] != self.node_id and not routing.is_known(self._known, node[0])
+        ]
+    
+    def _verify_peers(self, nodes: List[Tuple[int, str, int]]) -> List[Tuple[int, str, int]]:
+        """Ping peers concurrently and return the ones that answered."""
+        # Each ping is bounded by PEER_VERIFY_TIMEOUT, so collecting the results cannot hang
+        results = self._io_pool.map(self._verify_peer, nodes)
+        return [node for node, reachable in zip(nodes, results) if reachable]
     
     def join_network(self, bootstrap_node: Tuple[str, int]):
         """Join the Pastry network through a bootstrap node."""
@@ -235,13 +339,14 @@ class PastryNode:
             
             if response.get('status') == 'success':
                 # Update our routing tables with the received information
-                routing_info = response.get('routing_info', {})
-                if routing_info:
-                    # Process routing information
-                    self.handle_routing_info({'routing_info': routing_info})
-                    
-                    print(f"Node {self.node_id} successfully joined the network")
-                    return True
+                # The snapshot is empty when the bootstrap node knows no other peers yet
+                snapshot = unpack_peers(response.get('snapshot', b''))
+                
+                # Only add peers that answer, in a single bulk pass
+                self._bulk_update_routing(self._verify_peers(self._new_peers(snapshot)))
+                
+                print(f"Node {self.node_id} successfully joined the network")
+                return True
             
             print(f"Failed to join the network: {response.get('message', 'Unknown error')}")
             return False
@@ -262,6 +367,7 @@ class PastryNode:
             store_message = {
                 'type': 'STORE',
                 'key': key,
+                'key_hash': key_hash,
                 'value': value
             }
             
@@ -278,8 +384,9 @@ class PastryNode:
         key_hash = hash_key(key)
         
         # Check if this node has the key
-        if key_hash in self.storage:
-            return {'status': 'success', 'value': self.storage[key_hash]}
+        value = self.storage.get(key_hash, _MISSING)
+        if value is not _MISSING:
+            return {'status': 'success', 'value': value}
         
         # Check if this node is responsible for the key
         if self.is_responsible_for_key(key_hash):
@@ -288,7 +395,8 @@ class PastryNode:
         # Forward to the appropriate node
         lookup_message = {
             'type': 'LOOKUP',
-            'key': key
+            'key': key,
+            'key_hash': key_hash
         }
         
         next_node = self.route_to_node(key_hash)
@@ -303,25 +411,34 @@ class PastryNode:
         new_node_ip = message['ip']
         new_node_port = message['port']
         
+        # Node IDs index the known-peers bitset, so refuse any outside the ID space
+        if not is_valid_node_id(new_node_id):
+            return {'status': 'error', 'message': f'Invalid node ID {new_node_id!r}'}
+        
+        # Peers are passed on packed into PEER_STRUCT, so refuse any address it cannot hold
+        if not is_valid_address(new_node_ip, new_node_port):
+            return {'status': 'error', 'message': f'Invalid node address {new_node_ip!r}:{new_node_port!r}'}
+        
         # Update routing tables with the new node
         self.update_routing_tables(new_node_id, new_node_ip, new_node_port)
         
-        # Return routing information to the new node
+        # Return only the known peers that the new node would keep, packed 8 bytes per peer
         return {
             'status': 'success',
-            'routing_info': {
-                'node_id': self.node_id,
-                'leaf_set_smaller': self.leaf_set_smaller,
-                'leaf_set_larger': self.leaf_set_larger,
-                'routing_table': self.routing_table
-            }
+            'snapshot': pack_peers(self._snapshot_for(new_node_id))
         }
     
+    def _snapshot_for(self, new_node_id: int) -> List[Tuple[int, str, int]]:
+        """Select the known peers that fill a joining node's leaf sets and routing table."""
+        return routing.select_useful_peers(new_node_id, self._snapshot.peers)
+    
     def handle_store(self, message: Dict) -> Dict:
         """Handle a request to store a key-value pair."""
         key = message['key']
         value = message['value']
-        key_hash = hash_key(key)
+        key_hash = message.get('key_hash')
+        if key_hash is None:
+            key_hash = hash_key(key)
         
         # Check if this node is responsible for the key
         if self.is_responsible_for_key(key_hash):
@@ -335,9 +452,10 @@ class PastryNode:
                 forward_message = {
                     'type': 'STORE',
                     'key': key,
+                    'key_hash': key_hash,
                     'value': value
                 }
-                response = self.send_message(next_node[1], next_node[2], forward_message)
+                response = self.send_message(next_node[1], next_node[2], forward_message, timeout=FORWARD_TIMEOUT)
                 return response
             else:
                 # If no suitable node found, store locally as a fallback
@@ -347,11 +465,14 @@ class PastryNode:
     def handle_lookup(self, message: Dict) -> Dict:
         """Handle a request to look up a value by key."""
         key = message['key']
-        key_hash = hash_key(key)
+        key_hash = message.get('key_hash')
+        if key_hash is None:
+            key_hash = hash_key(key)
         
         # Check if this node has the key
-        if key_hash in self.storage:
-            return {'status': 'success', 'value': self.storage[key_hash]}
+        value = self.storage.get(key_hash, _MISSING)
+        if value is not _MISSING:
+            return {'status': 'success', 'value': value}
         
         # Check if this node is responsible for the key
         if self.is_responsible_for_key(key_hash):
@@ -363,9 +484,10 @@ class PastryNode:
             # Forward the lookup request
             forward_message = {
                 'type': 'LOOKUP',
-                'key': key
+                'key': key,
+                'key_hash': key_hash
             }
-            response = self.send_message(next_node[1], next_node[2], forward_message)
+            response = self.send_message(next_node[1], next_node[2], forward_message, timeout=FORWARD_TIMEOUT)
             return response
         else:
             return {'status': 'error', 'message': 'No route to key'}
@@ -379,23 +501,45 @@ class PastryNode:
             node_id = routing_info.get('node_id')
             leaf_set_smaller = routing_info.get('leaf_set_smaller', [])
             leaf_set_larger = routing_info.get('leaf_set_larger', [])
-            routing_table = routing_info.get('routing_table', [])
+            rt_entries = routing_info.get('rt_entries', [])
             
-            # Update our routing information with the received data
-            for node in leaf_set_smaller + leaf_set_larger:
-                if node and node[0] != self.node_id:
-                    self.update_routing_tables(node[0], node[1], node[2])
+            # Collect the unique peers we were told about
+            nodes = {node[0]: tuple(node) for node in leaf_set_smaller + leaf_set_larger if node}
+            nodes.update((entry[2], tuple(entry[2:])) for entry in rt_entries)
+            # Drop peers whose ID or address could not be tracked and passed on in a JOIN reply
+            valid = [
+                node for node in nodes.values()
+                if is_valid_node_id(node[0]) and is_valid_address(node[1], node[2])
+            ]
             
-            # Update with routing table entries
-            for row in routing_table:
-                for node in row:
-                    if node and node[0] != self.node_id:
-                        self.update_routing_tables(node[0], node[1], node[2])
+            # Only add new peers that answer, then update our routing information in a single pass
+            self._bulk_update_routing(self._verify_peers(self._new_peers(valid)))
         
         return {'status': 'success'}
     
+    def handle_ping(self, message: Dict) -> Dict:
+        """Handle a liveness check from another node."""
+        return {'status': 'success', 'node_id': self.node_id}
+    
+    async def _close(self):
+        """Stop accepting connections and close every open one."""
+        self._server.close()
+        for _, writer in self._conn_pool.values():
+            writer.close()
+        self._conn_pool.clear()
+        
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
     def shutdown(self):
         """Shutdown the node."""
         self.running = False
-        self.server_socket.close()
+        self._handler_pool.shutdown(wait=False, cancel_futures=True)
+        self._io_pool.shutdown(wait=False)
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.server_thread.join()
+        self._loop.close()
         print(f"Node {self.node_id} shut down")
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""Leaf set and routing table logic for a Pastry node.
+
+Free functions over plain lists, dicts and ints, fully annotated so the module can be
+compiled with `mypyc routing.py`. PastryNode owns the state and the locking.
+"""
+import bisect
+from typing import Dict, List, Optional, Tuple
+
+from utils import ID_BITS, ID_SPACE, ROUTING_TABLE_ROWS, LEAF_SET_SIZE
+
+Node = Tuple[int, str, int]  # (node_id, ip, port)
+
+# Shift that brings the 4-bit column window for each routing table row down to the low bits
+ROW_SHIFTS: Tuple[int, ...] = tuple(max(0, ID_BITS - row - 4) for row in range(ROUTING_TABLE_ROWS))
+
+def is_known(known: bytearray, node_id: int) -> bool:
+    """Check a node's bit in a known-peers bitset."""
+    return bool(known[node_id >> 3] & (1 << (node_id & 7)))
+
+def set_known(known: bytearray, node_id: int, flag: bool) -> None:
+    """Set or clear a node's bit in a known-peers bitset."""
+    if flag:
+        known[node_id >> 3] |= 1 << (node_id & 7)
+    else:
+        known[node_id >> 3] &= ~(1 << (node_id & 7)) & 0xFF
+
+def routing_slot(self_id: int, node_id: int) -> Optional[Tuple[int, int]]:
+    """Return the (row, col) routing table slot for a node, or None if it has no row."""
+    # The row is the index of the first bit that differs from our ID
+    diff: int = node_id ^ self_id
+    row: int = ID_BITS - diff.bit_length()
+    if row >= ROUTING_TABLE_ROWS:
+        return None
+    # The column is the 4 bits of the node ID starting at that bit
+    return (row, (node_id >> ROW_SHIFTS[row]) & 0xF)
+
+def in_routing_state(self_id: int, leaf_meta: Dict[int, Tuple[str, int]],
+                     routing_table: Dict[Tuple[int, int], Node], node_id: int) -> bool:
+    """Check whether a node is currently in the leaf sets or routing table."""
+    if node_id in leaf_meta:
+        return True
+    # A node can only ever occupy one routing table slot
+    slot: Optional[Tuple[int, int]] = routing_slot(self_id, node_id)
+    if slot is None:
+        return False
+    node: Optional[Node] = routing_table.get(slot)
+    return node is not None and node[0] == node_id
+
+def leaf_node(leaf_meta: Dict[int, Tuple[str, int]], node_id: int) -> Node:
+    """Build the (node_id, ip, port) entry for a leaf set member."""
+    ip, port = leaf_meta[node_id]
+    return (node_id, ip, port)
+
+def trim_leaf_sets(self_id: int, leaf_ids: List[int], leaf_meta: Dict[int, Tuple[str, int]]) -> List[int]:
+    """Keep only the closest LEAF_SET_SIZE nodes on each side of our ID; return the dropped IDs."""
+    dropped: List[int] = []
+    split: int = bisect.bisect_left(leaf_ids, self_id)
+    if len(leaf_ids) - split > LEAF_SET_SIZE:
+        dropped += leaf_ids[split + LEAF_SET_SIZE:]
+        del leaf_ids[split + LEAF_SET_SIZE:]
+    if split > LEAF_SET_SIZE:
+        dropped += leaf_ids[:split - LEAF_SET_SIZE]
+        del leaf_ids[:split - LEAF_SET_SIZE]
+    for node_id in dropped:
+        del leaf_meta[node_id]
+    return dropped
+
+def place_in_routing_table(self_id: int, routing_table: Dict[Tuple[int, int], Node],
+                           rt_by_row: List[Dict[int, Node]], node: Node) -> Optional[int]:
+    """Store a node in its routing table slot (simplified); return the ID it displaced, if any."""
+    # In a real implementation, this would use prefix matching
+    slot: Optional[Tuple[int, int]] = routing_slot(self_id, node[0])
+    if slot is None:
+        return None
+    previous: Optional[Node] = routing_table.get(slot)
+    routing_table[slot] = node
+    rt_by_row[slot[0]][slot[1]] = node
+    return previous[0] if previous is not None and previous[0] != node[0] else None
+
+def _refresh_known(self_id: int, leaf_meta: Dict[int, Tuple[str, int]], routing_table: Dict[Tuple[int, int], Node],
+                   known: bytearray, node_ids: List[int]) -> None:
+    """Bring the known-peers bits of the given nodes in line with the routing state."""
+    for node_id in node_ids:
+        set_known(known, node_id, in_routing_state(self_id, leaf_meta, routing_table, node_id))
+
+def update_routing_tables(self_id: int, leaf_ids: List[int], leaf_meta: Dict[int, Tuple[str, int]],
+                          routing_table: Dict[Tuple[int, int], Node], rt_by_row: List[Dict[int, Node]],
+                          known: bytearray, node: Node) -> bool:
+    """Add a single node to the leaf sets and routing table; return whether anything changed."""
+    node_id: int = node[0]
+    # Node IDs are derived from the address, so a known ID needs no update
+    if is_known(known, node_id):
+        return False
+    
+    bisect.insort(leaf_ids, node_id)
+    leaf_meta[node_id] = (node[1], node[2])
+    touched: List[int] = trim_leaf_sets(self_id, leaf_ids, leaf_meta)
+    
+    displaced: Optional[int] = place_in_routing_table(self_id, routing_table, rt_by_row, node)
+    if displaced is not None:
+        touched.append(displaced)
+    touched.append(node_id)
+    _refresh_known(self_id, leaf_meta, routing_table, known, touched)
+    return True
+
+def bulk_update_routing(self_id: int, leaf_ids: List[int], leaf_meta: Dict[int, Tuple[str, int]],
+                        routing_table: Dict[Tuple[int, int], Node], rt_by_row: List[Dict[int, Node]],
+                        known: bytearray, nodes: Dict[int, Tuple[str, int]]) -> bool:
+    """Add many deduplicated nodes at once, sorting the leaf sets only once; return whether anything changed."""
+    new_nodes: Dict[int, Tuple[str, int]] = {
+        node_id: addr for node_id, addr in nodes.items() if not is_known(known, node_id)
+    }
+    if not new_nodes:
+        return False
+    
+    leaf_meta.update(new_nodes)
+    leaf_ids[:] = sorted(leaf_meta)
+    touched: List[int] = trim_leaf_sets(self_id, leaf_ids, leaf_meta)
+    
+    for node_id, (ip, port) in new_nodes.items():
+        displaced: Optional[int] = place_in_routing_table(self_id, routing_table, rt_by_row, (node_id, ip, port))
+        if displaced is not None:
+            touched.append(displaced)
+    touched += new_nodes
+    _refresh_known(self_id, leaf_meta, routing_table, known, touched)
+    return True
+
+def select_useful_peers(target_id: int, peers: Dict[int, Tuple[str, int]]) -> List[Node]:
+    """Pick the peers a node with target_id would keep in its leaf sets and routing table."""
+    # Build the routing state target_id would end up with and return everything in it
+    leaf_ids: List[int] = []
+    leaf_meta: Dict[int, Tuple[str, int]] = {}
+    routing_table: Dict[Tuple[int, int], Node] = {}
+    rt_by_row: List[Dict[int, Node]] = [{} for _ in range(ROUTING_TABLE_ROWS)]
+    candidates: Dict[int, Tuple[str, int]] = {node_id: addr for node_id, addr in peers.items() if node_id != target_id}
+    bulk_update_routing(target_id, leaf_ids, leaf_meta, routing_table, rt_by_row, bytearray(ID_SPACE // 8), candidates)
+    
+    useful: Dict[int, Node] = {node_id: leaf_node(leaf_meta, node_id) for node_id in leaf_ids}
+    for node in routing_table.values():
+        useful[node[0]] = node
+    return list(useful.values())
+
+def is_responsible_for_key(self_id: int, leaf_ids: List[int], key_hash: int) -> bool:
+    """Determine if a node is responsible for a key."""
+    # Check if we have any nodes in our leaf sets
+    if not leaf_ids:
+        return True
+    
+    split: int = bisect.bisect_left(leaf_ids, self_id)
+    has_smaller: bool = split > 0
+    has_larger: bool = split < len(leaf_ids)
+    
+    # Check if the key is between this node and the closest smaller node
+    if has_smaller and key_hash > leaf_ids[split - 1] and key_hash <= self_id:
+        return True
+    
+    # Check if the key is between this node and the closest larger node
+    if has_larger and key_hash > self_id and key_hash <= leaf_ids[split]:
+        return True
+    
+    # Handle wrap-around in the ID space
+    if has_smaller and has_larger:
+        largest_node: int = leaf_ids[-1]
+        smallest_node: int = leaf_ids[0]
+        
+        if self_id > largest_node and key_hash > self_id:
+            return True
+        if self_id < smallest_node and key_hash < self_id:
+            return True
+    
+    return False
+
+def find_route(self_id: int, leaf_ids: List[int], leaf_meta: Dict[int, Tuple[str, int]],
+               rt_by_row: List[Dict[int, Node]], key_hash: int) -> Optional[Node]:
+    """Compute the next hop for a key from the leaf sets and routing table."""
+    split: int = bisect.bisect_left(leaf_ids, self_id)
+    
+    # Check if the key is in the range of our leaf sets
+    if split > 0 and key_hash <= leaf_ids[split - 1]:
+        return leaf_node(leaf_meta, leaf_ids[split - 1])
+    
+    if split < len(leaf_ids) and key_hash >= leaf_ids[split]:
+        return leaf_node(leaf_meta, leaf_ids[split])
+    
+    # Use the routing table (simplified)
+    diff: int = key_hash ^ self_id
+    i: int
+    for i in range(ID_BITS - diff.bit_length(), ROUTING_TABLE_ROWS):
+        # Only rows where the key differs from our ID at bit i are candidates
+        if not (diff >> (ID_BITS - 1 - i)) & 1:
+            continue
+        
+        # Calculate column based on the next 4 bits
+        col: int = (key_hash >> ROW_SHIFTS[i]) & 0xF
+        row_entries: Dict[int, Node] = rt_by_row[i]
+        node: Optional[Node] = row_entries.get(col)
+        if node is not None:
+            return node
+        
+        # If exact match not found, use the occupied column closest to the key's
+        if row_entries:
+            closest_col: int = min(row_entries, key=lambda j: abs(j - col))
+            return row_entries[closest_col]
+    
+    # If no suitable node found in routing table, return the closest node from leaf sets
+    if not leaf_ids:
+        return None
+    
+    # Only the neighbours on either side of the key's insertion point can be closest
+    idx: int = bisect.bisect_left(leaf_ids, key_hash)
+    candidates: List[int] = leaf_ids[max(0, idx - 1):idx + 1]
+    closest_id: int = min(candidates, key=lambda node_id: abs(node_id - key_hash))
+    return leaf_node(leaf_meta, closest_id)
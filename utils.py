@@ -1,4 +1,16 @@
+import base64
 import hashlib
+import ipaddress
+import json
+import socket
+import struct
+from functools import lru_cache, partial
+from typing import Iterable, List, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional
+    msgpack = None
 
 # Configuration
 ID_BITS = 16  # Number of bits in the node ID
@@ -6,10 +18,63 @@ ID_SPACE = 2**ID_BITS  # Size of the ID space
 ROUTING_TABLE_ROWS = 4  # Number of rows in the routing table (simplified)
 ROUTING_TABLE_COLS = 2**4  # Number of columns per row (simplified)
 LEAF_SET_SIZE = 4  # Number of nodes in each leaf set (simplified)
+ROUTE_CACHE_MAX = 1024  # Maximum number of cached key routes per node
+ROUTE_CACHE_TTL = 30.0  # Seconds before a cached route is considered stale
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # Largest message accepted from the wire, in bytes
+PEER_VERIFY_WORKERS = 8  # Concurrent verification pings per node
+PEER_VERIFY_TIMEOUT = 2.0  # Seconds to wait for a peer to answer a verification ping
+HANDLER_WORKERS = 32  # Incoming requests a node handles concurrently
+FORWARD_TIMEOUT = 5.0  # Seconds a handler waits for the reply to a forwarded request
 
+@lru_cache(maxsize=4096)
 def hash_key(key: str) -> int:
     """Hash a key to get its position in the ID space."""
-    hash_obj = hashlib.sha1(key.encode())
-    # Take first 16 bits (2 bytes) of the hash
-    hash_bytes = hash_obj.digest()[:2]
-    return int.from_bytes(hash_bytes, byteorder='big')
\ No newline at end of file
+    # A 2-byte BLAKE2s digest covers the 16-bit ID space exactly and is cheaper than SHA-1
+    return int.from_bytes(hashlib.blake2s(key.encode(), digest_size=ID_BITS // 8).digest(), byteorder='big')
+
+# Wire format: MessagePack when available, JSON otherwise.
+# Every node in a network must use the same one.
+if msgpack is not None:
+    encode_message = msgpack.packb
+    # Stored values may be dicts with non-string keys, which msgpack refuses by default
+    decode_message = partial(msgpack.unpackb, raw=False, use_list=True, strict_map_key=False)
+else:
+    def encode_message(message) -> bytes:
+        """Serialize a message for the wire."""
+        return json.dumps(message).encode('utf-8')
+    
+    def decode_message(data) -> dict:
+        """Deserialize a message received from the wire."""
+        return json.loads(data)
+
+
+# A peer packed for the wire: node ID (u16), IPv4 address (4 bytes), port (u16)
+PEER_STRUCT = struct.Struct('!H4sH')
+
+def is_valid_node_id(node_id: int) -> bool:
+    """Check that a node ID from the wire lies in the ID space."""
+    return isinstance(node_id, int) and 0 <= node_id < ID_SPACE
+
+def is_valid_address(ip: str, port: int) -> bool:
+    """Check that a peer address fits PEER_STRUCT: a dotted-quad IPv4 address and a 16-bit port."""
+    if not isinstance(ip, str) or not isinstance(port, int) or not 0 <= port <= 0xFFFF:
+        return False
+    try:
+        ipaddress.IPv4Address(ip)
+    except ValueError:
+        return False
+    return True
+
+def pack_peers(peers: Iterable[Tuple[int, str, int]]) -> Union[bytes, str]:
+    """Pack (node_id, ip, port) peers into one contiguous blob, 8 bytes per peer.
+    
+    Peer addresses must have passed is_valid_address before they entered the routing state."""
+    blob = b''.join(PEER_STRUCT.pack(node_id, socket.inet_aton(ip), port) for node_id, ip, port in peers)
+    # MessagePack carries raw bytes; JSON needs them as text
+    return blob if msgpack is not None else base64.b64encode(blob).decode('ascii')
+
+def unpack_peers(data: Union[bytes, str]) -> List[Tuple[int, str, int]]:
+    """Unpack a blob produced by pack_peers."""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return [(node_id, socket.inet_ntoa(ip), port) for node_id, ip, port in PEER_STRUCT.iter_unpack(data)]